@@ -6,6 +6,8 @@ from ..util import _doc_params
 from ..util.graph import _get_igraph_from_adjacency, layout_components
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 import random
 
 _define_clonotypes_doc = """\
@@ -37,6 +39,8 @@ partitions
 
     The difference is that the Leiden algorithm further divides
     fully connected subgraphs into highly-connected modules.
+    Leiden clustering uses the implementation built into `igraph`
+    (`igraph.Graph.community_leiden`), it does not require `leidenalg`.
 resolution
     `resolution` parameter for the leiden algorithm.
 n_iterations
@@ -78,6 +82,10 @@ def define_clonotype_clusters(
     Requires running :func:`scirpy.pp.ir_neighbors` first with the same
     `sequence` and `metric` values first.
 
+    The distances are computed only once by :func:`scirpy.pp.ir_neighbors`
+    and stored in `adata.uns`. Calling this function repeatedly, e.g.
+    with different values for `resolution`, reuses them.
+
     Parameters
     ----------
     adata
@@ -158,19 +166,36 @@ def _define_clonotypes(
         raise ValueError(
             "Connectivities were not found. Did you run `pp.ir_neighbors`?"
         )
-    g = _get_igraph_from_adjacency(conn)
+
+    conn = csr_matrix(conn)
+    _, component_labels = connected_components(conn, directed=False)
 
     if partitions == "leiden":
+        # Cells without neighbors always form a partition on their own and
+        # don't contribute to the modularity. Only run the Leiden algorithm on the
+        # cells in connected components with more than one cell.
+        component_sizes = np.bincount(component_labels)[component_labels]
+        leiden_idx = np.where(component_sizes > 1)[0]
+        singleton_idx = np.where(component_sizes == 1)[0]
+
+        g = _get_igraph_from_adjacency(conn[leiden_idx, :][:, leiden_idx])
         part = g.community_leiden(
             objective_function="modularity",
             resolution_parameter=resolution,
             n_iterations=n_iterations,
         )
+        membership = np.empty(conn.shape[0], dtype=int)
+        membership[leiden_idx] = part.membership
+        membership[singleton_idx] = np.arange(len(singleton_idx)) + len(part)
+        # number partitions in the order of their first appearance
+        membership, _ = pd.factorize(membership)
     else:
-        part = g.clusters(mode="weak")
+        # the partitions are the connected components. No need to build an
+        # igraph object for that.
+        membership, _ = pd.factorize(component_labels)
 
     # basic clonotype = graph partition
-    clonotype = [str(x) for x in part.membership]
+    clonotype = [str(x) for x in membership]
 
     # add v gene to definition
     if same_v_gene == "primary_only":
@@ -200,7 +225,10 @@ def _define_clonotypes(
             f"{x}_{group}" for x, group in zip(clonotype, adata.obs[within_group])
         ]
 
-    clonotype_size = pd.Series(clonotype).groupby(clonotype).transform("count").values
+    # hash the clonotype keys into integer codes and count them, rather than
+    # grouping by the (object) string keys
+    clonotype_codes, _ = pd.factorize(np.asarray(clonotype, dtype=object))
+    clonotype_size = np.bincount(clonotype_codes)[clonotype_codes]
     assert len(clonotype) == len(clonotype_size) == adata.obs.shape[0]
 
     if not inplace:
@@ -297,13 +325,14 @@ def clonotype_network(
             "need to re-run `pp.ir_neighbors?"
         )
 
-    graph = _get_igraph_from_adjacency(conn)
-
-    # remove singletons/small subgraphs
+    # remove singletons/small subgraphs. Subset the sparse matrix rather than the
+    # graph, to avoid building the igraph object for the full dataset. Subset
+    # rows and columns sequentially, which is a lot faster than 2D fancy indexing.
     subgraph_idx = np.where(clonotype_size >= min_size)[0]
     if len(subgraph_idx) == 0:
         raise ValueError("No subgraphs with size >= {} found.".format(min_size))
-    graph = graph.subgraph(subgraph_idx)
+    conn = csr_matrix(conn)[subgraph_idx, :][:, subgraph_idx]
+    graph = _get_igraph_from_adjacency(conn)
 
     default_layout_kwargs = {"weights": "weight"} if layout == "fr" else dict()
     layout_kwargs = default_layout_kwargs if layout_kwargs is None else layout_kwargs
@@ -356,6 +385,7 @@ def clonotype_network_igraph(
 
     conn = adata.uns[neighbors_key]["connectivities"]
     idx = np.where(~np.any(np.isnan(adata.obsm["X_" + basis]), axis=1))[0]
-    g = _get_igraph_from_adjacency(conn).subgraph(idx)
+    conn = csr_matrix(conn)[idx, :][:, idx]
+    g = _get_igraph_from_adjacency(conn)
     layout = ig.Layout(coords=adata.obsm["X_" + basis][idx, :].tolist())
     return g, layout
@@ -1,6 +1,5 @@
 from anndata import AnnData
 from typing import Union
-import numpy as np
 import pandas as pd
 from ..util import _is_na, _normalize_counts
 from typing import Sequence
@@ -21,26 +20,33 @@ def _group_abundance(
 
     # normalize to fractions
     scale_vector = _normalize_counts(ir_obs, normalize=fraction, default_col=groupby)
-    ir_obs = ir_obs.assign(count=1, weight=scale_vector)
+
+    # Group by integer codes rather than by (potentially string) labels.
+    # With `sort=True`, the order of the codes is the order of the labels.
+    group_codes, group_labels = pd.factorize(ir_obs[groupby], sort=True)
+    target_codes, target_labels = pd.factorize(ir_obs[target_col], sort=True)
 
     # Calculate distribution of lengths in each group. Use sum instead of count
-    # to reflect weights
-    group_counts = (
-        ir_obs.loc[:, [groupby, target_col, "count", "weight"]]
-        .groupby([groupby, target_col], observed=True)
-        .sum()
-        .reset_index()
-        .rename(columns={"weight": "weighted_count"})
+    # to reflect weights. Without normalization, all weights are 1 and the
+    # counts don't need to be computed separately. The weights are grouped
+    # directly, without adding them as column to (a copy of) `ir_obs`.
+    grouped = pd.Series(scale_vector).groupby([group_codes, target_codes])
+    group_counts = grouped.sum().to_frame("weight")
+    if fraction:
+        group_counts["count"] = grouped.size()
+    group_counts.index = pd.MultiIndex(
+        levels=[group_labels, target_labels],
+        codes=[group_counts.index.get_level_values(i) for i in range(2)],
+        names=[groupby, target_col],
     )
 
-    result_df = group_counts.pivot(
-        index=groupby, columns=target_col, values="weighted_count"
-    ).fillna(value=0.0)
+    result_df = group_counts["weight"].unstack(fill_value=0.0)
 
     # required that we can still sort by abundance even if normalized
-    result_df_count = group_counts.pivot(
-        index=groupby, columns=target_col, values="count"
-    ).fillna(value=0.0)
+    if fraction:
+        result_df_count = group_counts["count"].unstack(fill_value=0)
+    else:
+        result_df_count = result_df
 
     # By default, the most abundant group should be the first on the plot,
     # therefore we need their order
@@ -48,15 +54,13 @@ def _group_abundance(
         ranked_target = sorted(result_df.index)
     elif isinstance(sort, str) and sort == "count":
         ranked_target = (
-            result_df_count.apply(np.sum, axis=1)
-            .sort_values(ascending=False)
-            .index.values
+            result_df_count.sum(axis=1).sort_values(ascending=False).index.values
         )
     else:
         ranked_target = sort
 
     ranked_groups = (
-        result_df_count.apply(np.sum, axis=0).sort_values(ascending=False).index.values
+        result_df_count.sum(axis=0).sort_values(ascending=False).index.values
     )
     result_df = result_df.loc[ranked_target, ranked_groups]
 
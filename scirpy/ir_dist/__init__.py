@@ -2,11 +2,12 @@ import parasail
 from ..util._multiprocessing import EnhancedPool as Pool
 import itertools
 from anndata import AnnData
-from typing import Union, Sequence, List, Tuple, Dict, Optional
+from typing import Union, Sequence, List, Tuple, Dict, Optional, Iterable
 from .._compat import Literal
 import numpy as np
+import pandas as pd
 from scanpy import logging
-from ..util import _is_na, deprecated
+from ..util import _is_na, _reduce_nonzero, deprecated
 import abc
 from Levenshtein import distance as levenshtein_dist
 from Levenshtein import hamming as hamming_dist
@@ -167,6 +168,48 @@ class ParallelDistanceCalculator(DistanceCalculator):
         """
         pass
 
+    @staticmethod
+    def _iter_pairs_by_length(
+        seqs1: Sequence[str],
+        seqs2: Union[Sequence[str], None],
+        max_len_diff: int,
+    ) -> Iterable[Tuple[int, str, int, str]]:
+        """Iterate over all pairs of sequences whose lengths differ by at most
+        `max_len_diff`.
+
+        The sequences of `seqs2` are grouped by their length, such that pairs that
+        can't be within the cutoff (e.g. the edit distance is at least the
+        difference in length) are never visited.
+
+        Parameters
+        ----------
+        seqs1
+            array containing sequences
+        seqs2
+            other array containing sequences. If `None`, iterate over the upper
+            triangle (including the diagonal) of `seqs1` against itself.
+        max_len_diff
+            maximum difference in length of two sequences
+
+        Yields
+        ------
+        (row, seq1, col, seq2) tuples. Pairs are not ordered by column.
+        """
+        square_mat = seqs2 is None
+        if square_mat:
+            seqs2 = seqs1
+        seqs2_by_len = {}
+        for col, s2 in enumerate(seqs2):
+            seqs2_by_len.setdefault(len(s2), []).append((col, s2))
+
+        for row, s1 in enumerate(seqs1):
+            l1 = len(s1)
+            for l2 in range(l1 - max_len_diff, l1 + max_len_diff + 1):
+                for col, s2 in seqs2_by_len.get(l2, ()):
+                    if square_mat and col < row:
+                        continue
+                    yield row, s1, col, s2
+
     @staticmethod
     def _block_iter(
         seqs1: Sequence[str],
@@ -323,21 +366,18 @@ class LevenshteinDistanceCalculator(ParallelDistanceCalculator):
 
     def _compute_block(self, seqs1, seqs2, origin):
         origin_row, origin_col = origin
-        if seqs2 is not None:
-            # compute the full matrix
-            coord_iterator = itertools.product(enumerate(seqs1), enumerate(seqs2))
-        else:
-            # compute only upper triangle in this case
-            coord_iterator = itertools.combinations_with_replacement(
-                enumerate(seqs1), r=2
-            )
+        # the edit distance is at least the difference in length. If `seqs2` is
+        # None, only the upper triangle is computed.
+        coord_iterator = self._iter_pairs_by_length(seqs1, seqs2, self.cutoff)
 
         result = []
-        for (row, s1), (col, s2) in coord_iterator:
+        for row, s1, col, s2 in coord_iterator:
             d = levenshtein_dist(s1, s2)
             if d <= self.cutoff:
                 result.append((d + 1, origin_row + row, origin_col + col))
 
+        # restore row-major order
+        result.sort(key=lambda x: (x[1], x[2]))
         return result
 
 
@@ -374,21 +414,12 @@ class HammingDistanceCalculator(ParallelDistanceCalculator):
 
     def _compute_block(self, seqs1, seqs2, origin):
         origin_row, origin_col = origin
-        if seqs2 is not None:
-            # compute the full matrix
-            coord_iterator = itertools.product(enumerate(seqs1), enumerate(seqs2))
-        else:
-            # compute only upper triangle in this case
-            coord_iterator = itertools.combinations_with_replacement(
-                enumerate(seqs1), r=2
-            )
+        # require identical length of sequences. If `seqs2` is None, only the
+        # upper triangle is computed.
+        coord_iterator = self._iter_pairs_by_length(seqs1, seqs2, 0)
 
         result = []
-        for (row, s1), (col, s2) in coord_iterator:
-
-            # require identical length of sequences
-            if len(s1) != len(s2):
-                continue
+        for row, s1, col, s2 in coord_iterator:
             d = hamming_dist(s1, s2)
             if d <= self.cutoff:
                 result.append((d + 1, origin_row + row, origin_col + col))
@@ -624,9 +655,39 @@ class IrNeighbors:
         self._dist_mat = None
         logging.info("Finished initalizing IrNeighbors object. ", time=start)
 
+    @staticmethod
+    def _seq_to_code(
+        unique_seqs: Union[np.ndarray, pd.Index], cdr_seqs: np.ndarray
+    ) -> np.ndarray:
+        """
+        Encode the CDR3 sequences of a single chain (e.g. `TRA_1`) as integer codes.
+
+        The code of a sequence is its index in `unique_seqs`. Cells without a
+        CDR3 sequence (or with a sequence not in `unique_seqs`) receive `-1`.
+
+        Parameters
+        ----------
+        unique_seqs
+            Pool of all unique cdr3 sequences (length = #unique cdr3 sequences).
+            When encoding multiple chains against the same pool, pass a
+            `pd.Index`: its hash table is built only once and reused.
+        cdr_seqs
+            CDR3 sequences for the current chain (length = #cells)
+
+        Returns
+        -------
+        Array of int32 codes (length = #cells)
+        """
+        if not isinstance(unique_seqs, pd.Index):
+            unique_seqs = pd.Index(np.asarray(unique_seqs, dtype=str))
+        return unique_seqs.get_indexer(np.asarray(cdr_seqs)).astype(np.int32)
+
     @staticmethod
     def _seq_to_cell_idx(
-        unique_seqs: np.ndarray, cdr_seqs: np.ndarray
+        unique_seqs: np.ndarray,
+        cdr_seqs: np.ndarray,
+        *,
+        seq_codes: Optional[np.ndarray] = None,
     ) -> Dict[int, List[int]]:
         """
         Compute sequence to cell index for a single chain (e.g. `TRA_1`).
@@ -634,34 +695,31 @@ class IrNeighbors:
         Maps cell_idx -> [list, of, seq_idx].
         Useful to build a cell x cell matrix from a seq x seq matrix.
 
-        Computes magic lookup indexes in linear time.
-
         Parameters
         ----------
         unique_seqs
             Pool of all unique cdr3 sequences (length = #unique cdr3 sequences)
         cdr_seqs
             CDR3 sequences for the current chain (length = #cells)
+        seq_codes
+            The result of :meth:`_seq_to_code` for `unique_seqs` and `cdr_seqs`,
+            if already computed.
 
         Returns
         -------
         Sequence2Cell mapping
         """
-        # 1) reverse mapping of amino acid sequence to index in sequence-distance matrix
-        seq_to_index = {seq: i for i, seq in enumerate(unique_seqs)}
+        if seq_codes is None:
+            seq_codes = IrNeighbors._seq_to_code(unique_seqs, cdr_seqs)
 
-        # 2) indices of cells in adata that have a CDR3 sequence.
-        cells_with_chain = np.where(~_is_na(cdr_seqs))[0]
+        # indices of cells in adata that have a CDR3 sequence and the
+        # corresponding indices of the sequences in the distance matrix.
+        cells_with_chain = np.where(seq_codes >= 0)[0]
+        seq_inds = seq_codes[cells_with_chain]
 
-        # 3) indices of the corresponding sequences in the distance matrix.
-        seq_inds = {
-            chain_id: seq_to_index[cdr_seqs[chain_id]] for chain_id in cells_with_chain
-        }
-
-        # 4) list of cell-indices in the cell distance matrix for each sequence
-        seq_to_cell = {seq_id: list() for seq_id in seq_to_index.values()}
-        for cell_id in cells_with_chain:
-            seq_id = seq_inds[cell_id]
+        # list of cell-indices in the cell distance matrix for each sequence
+        seq_to_cell = {seq_id: list() for seq_id in range(len(unique_seqs))}
+        for cell_id, seq_id in zip(cells_with_chain.tolist(), seq_inds.tolist()):
             seq_to_cell[seq_id].append(cell_id)
 
         return seq_to_cell
@@ -689,25 +747,34 @@ class IrNeighbors:
                 for k in chain_inds
             }
             unique_seqs = np.hstack(list(cdr_seqs.values()))
-            unique_seqs = np.unique(unique_seqs[~_is_na(unique_seqs)]).astype(str)
+            # deduplicate using a hash table instead of sorting python objects.
+            # Only the (much smaller) pool of unique sequences needs to be sorted.
+            unique_seqs = pd.unique(unique_seqs[~_is_na(unique_seqs)])
+            unique_seqs = np.sort(unique_seqs.astype(str))
+            # encode the sequences of each chain as integer codes once, all
+            # lookups are based on the codes. The lookup table of the sequence
+            # pool is shared by all chains of the arm.
+            seq_index = pd.Index(unique_seqs)
+            seq_codes = {
+                k: self._seq_to_code(seq_index, cdr_seqs[k]) for k in chain_inds
+            }
             seq_to_cell = {
-                k: self._seq_to_cell_idx(unique_seqs, cdr_seqs[k]) for k in chain_inds
+                k: self._seq_to_cell_idx(
+                    unique_seqs, cdr_seqs[k], seq_codes=seq_codes[k]
+                )
+                for k in chain_inds
             }
             arm_dict[arm] = {
                 "chain_inds": chain_inds,
                 "unique_seqs": unique_seqs,
+                "seq_codes": seq_codes,
                 "seq_to_cell": seq_to_cell,
             }
 
             # need the count of chains per cell for the `all` strategies.
             if self.receptor_arms == "all" or self.dual_ir == "all":
                 arm_dict[arm]["chains_per_cell"] = np.sum(
-                    ~_is_na(
-                        self.adata.obs.loc[
-                            :, [f"IR_{arm}_{k}_cdr3{sequence}" for k in chain_inds]
-                        ]
-                    ),
-                    axis=1,
+                    [seq_codes[k] >= 0 for k in chain_inds], axis=0
                 )
 
         self.index_dict = arm_dict
@@ -812,7 +879,7 @@ class IrNeighbors:
 
     def _reduce_coord_dict(self, coord_dict):
         """Applies reduction functions to the coord dict.
-        Yield (coords, value) pairs."""
+        Yield (coords, value) pairs for all pairs of cells with a non-zero value."""
         start = logging.info("Constructing cell x cell distance matrix...")
         reduce_dual = (
             self._reduce_dual_all if self.dual_ir == "all" else self._reduce_dual_any
@@ -834,12 +901,69 @@ class IrNeighbors:
                 cell_row,
                 cell_col,
             )
-            yield (cell_row, cell_col), reduced
+            # Pairs that don't pass the reduction (e.g. in the `all` modes, when not
+            # all chains match) are dropped here rather than being stored as explicit
+            # zeros in the sparse matrix first.
+            if reduced != 0:
+                yield (cell_row, cell_col), reduced
+        logging.info("Finished constructing cell x cell distance matrix. ", time=start)
+
+    def _seq_to_cell_mat(self, arm: str, chain: int, n_seqs: int) -> csr_matrix:
+        """Build the (#cells x #unique sequences) one-hot matrix `P` that maps
+        each cell to its CDR3 sequence of the given chain.
+
+        With `P_c1` and `P_c2`, a sequence distance matrix `D` can be expanded to
+        a cell x cell matrix as `P_c1 @ D @ P_c2.T`. Each cell has at most one
+        sequence per chain, so every entry of the product is a single
+        entry of `D`.
+        """
+        seq_codes = self.index_dict[arm]["seq_codes"][chain]
+        dtype = self.index_dict[arm]["dist_mat"].dtype
+        cells = np.where(seq_codes >= 0)[0]
+        return csr_matrix(
+            (np.ones(len(cells), dtype=dtype), (cells, seq_codes[cells])),
+            shape=(self.adata.n_obs, n_seqs),
+        )
+
+    def _cell_dist_mat_min(self) -> csr_matrix:
+        """Compute the distance matrix by taking the minimum of all non-zero
+        distances over all chain combinations and receptor arms.
+
+        Only applicable if neither `dual_ir` nor `receptor_arms` is `all`.
+        Faster and less memory-intensive than `_cell_dist_mat_reduce`, because
+        the expansion to a cell x cell matrix and the reduction are sparse matrix
+        operations. The intermediate matrices only contain the distances of the
+        upper triangle of the sequence distance matrices.
+        """
+        start = logging.info("Constructing cell x cell distance matrix...")
+        cell_dist_mat = None
+        for arm, arm_info in self.index_dict.items():
+            # The sequence distance matrix only contains the upper triangle. It is
+            # expanded as is, the lower triangle is added once at the very end.
+            dist_mat = csr_matrix(arm_info["dist_mat"])
+            seq_to_cell_mats = {
+                chain: self._seq_to_cell_mat(arm, chain, dist_mat.shape[0])
+                for chain in arm_info["chain_inds"]
+            }
+            for c1, c2 in itertools.product(arm_info["chain_inds"], repeat=2):
+                tmp_dist_mat = (
+                    seq_to_cell_mats[c1] @ dist_mat @ seq_to_cell_mats[c2].T
+                ).tocsr()
+                cell_dist_mat = (
+                    tmp_dist_mat
+                    if cell_dist_mat is None
+                    else _reduce_nonzero(cell_dist_mat, tmp_dist_mat)
+                )
+        # Each pair of sequences is only contained once in the upper triangle.
+        # Since all combinations of chains are expanded, the distance of each pair
+        # of cells is either in (row, col) or (col, row).
+        cell_dist_mat = _reduce_nonzero(cell_dist_mat, cell_dist_mat.T.tocsr())
         logging.info("Finished constructing cell x cell distance matrix. ", time=start)
+        return cell_dist_mat
 
     def _cell_dist_mat_reduce(self):
         """Compute the distance matrix by using custom reduction functions.
-        More flexible than `_build_cell_dist_mat_min`, but requires more memory.
+        More flexible than `_cell_dist_mat_min`, but requires more memory.
         Reduce dual is called before reduce arms.
         """
         coord_dict = dict()
@@ -901,6 +1025,10 @@ class IrNeighbors:
             Number of CPUs to use for alignment, levenshtein or hamming distance.
             Default: use all CPUS.
         """
+        # Receptor arms are processed one after another on purpose: the parallel
+        # distance calculators already use a process pool with `n_jobs` workers
+        # per arm. Running arms in concurrent threads would oversubscribe the CPUs
+        # and fork the worker processes from a multi-threaded process.
         for arm, arm_dict in self.index_dict.items():
             start = logging.info(f"Computing {arm} pairwise distances...")
 
@@ -912,6 +1040,11 @@ class IrNeighbors:
             )
             logging.info(f"Finished computing {arm} pairwise distances.", time=start)
 
+        if self.dual_ir != "all" and self.receptor_arms != "all":
+            # the reduction is a simple minimum -> use sparse matrix operations
+            self._dist_mat = self._cell_dist_mat_min()
+            return
+
         try:
             coords, values = zip(*self._cell_dist_mat_reduce())
         except ValueError:
@@ -920,10 +1053,15 @@ class IrNeighbors:
             self._dist_mat = csr_matrix((self.adata.n_obs, self.adata.n_obs))
         else:
             rows, cols = zip(*coords)
+            # Use a signed dtype: in the `all` modes, distances of multiple chains
+            # are summed up and can exceed the cutoff. Converting them to
+            # connectivities would overflow with the unsigned dtype of the
+            # sequence distance matrices.
             dist_mat = coo_matrix(
-                (values, (rows, cols)), shape=(self.adata.n_obs, self.adata.n_obs)
+                (values, (rows, cols)),
+                shape=(self.adata.n_obs, self.adata.n_obs),
+                dtype=int,
             )
-            dist_mat.eliminate_zeros()
             self._dist_mat = dist_mat.tocsr()
 
     @property
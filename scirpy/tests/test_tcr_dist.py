@@ -10,6 +10,8 @@ from scirpy.ir_dist import (
 )
 import numpy as np
 import numpy.testing as npt
+import pandas as pd
+import itertools
 import scirpy as st
 import scipy.sparse
 from .fixtures import adata_cdr3
@@ -113,6 +115,31 @@ def test_identity_dist_with_two_seq_arrays():
     )
 
 
+def test_iter_pairs_by_length():
+    seqs = np.array(["A", "AAA", "AA"])
+    seqs2 = np.array(["AB", "BAA", "BBBB"])
+    pairs1 = ParallelDistanceCalculator._iter_pairs_by_length(seqs, None, 1)
+    pairs2 = ParallelDistanceCalculator._iter_pairs_by_length(seqs, seqs2, 1)
+    pairs3 = ParallelDistanceCalculator._iter_pairs_by_length(seqs, seqs2, 0)
+
+    assert sorted((row, col) for row, _, col, _ in pairs1) == [
+        (0, 0),
+        (0, 2),
+        (1, 1),
+        (1, 2),
+        (2, 2),
+    ]
+    assert sorted((row, col) for row, _, col, _ in pairs2) == [
+        (0, 0),
+        (1, 0),
+        (1, 1),
+        (1, 2),
+        (2, 0),
+        (2, 1),
+    ]
+    assert sorted((row, col) for row, _, col, _ in pairs3) == [(1, 1), (2, 0)]
+
+
 def test_levenshtein_compute_block():
     levenshtein1 = LevenshteinDistanceCalculator(1)
     seqs = np.array(["A", "AAA", "AA"])
@@ -251,6 +278,13 @@ def test_seq_to_cell_idx():
     assert result == {0: [0], 1: [2], 2: [1, 3], 3: [], 4: [5, 6]}
 
 
+def test_seq_to_code():
+    unique_seqs = np.array(["AAA", "ABA", "CCC", "XXX", "AA"])
+    cdr_seqs = np.array(["AAA", "CCC", "ABA", "CCC", np.nan, "AA", "AA"])
+    result = IrNeighbors._seq_to_code(unique_seqs, cdr_seqs)
+    npt.assert_equal(result, np.array([0, 2, 1, 2, -1, 4, 4]))
+
+
 def test_build_index_dict(adata_cdr3):
     tn = IrNeighbors(
         adata_cdr3,
@@ -267,6 +301,7 @@ def test_build_index_dict(adata_cdr3):
             "VJ": {
                 "chain_inds": [1],
                 "unique_seqs": ["GCGAUGGCG", "GCGGCGGCG", "GCUGCUGCU"],
+                "seq_codes": {1: np.array([1, 0, -1, 2, -1])},
                 "seq_to_cell": {1: {0: [1], 1: [0], 2: [3]}},
             }
         },
@@ -288,6 +323,10 @@ def test_build_index_dict(adata_cdr3):
             "VJ": {
                 "chain_inds": [1, 2],
                 "unique_seqs": ["AAA", "AHA"],
+                "seq_codes": {
+                    1: np.array([0, 1, -1, 0, -1]),
+                    2: np.array([1, -1, -1, 0, 0]),
+                },
                 "seq_to_cell": {
                     1: {0: [0, 3], 1: [1]},
                     2: {0: [3, 4], 1: [0]},
@@ -297,6 +336,10 @@ def test_build_index_dict(adata_cdr3):
             "VDJ": {
                 "chain_inds": [1, 2],
                 "unique_seqs": ["AAA", "KK", "KKK", "KKY", "LLL"],
+                "seq_codes": {
+                    1: np.array([3, 1, -1, 4, 4]),
+                    2: np.array([2, 2, -1, 0, -1]),
+                },
                 "seq_to_cell": {
                     1: {0: [], 1: [1], 2: [], 3: [0], 4: [3, 4]},
                     2: {0: [3], 1: [], 2: [0, 1], 3: [], 4: []},
@@ -322,6 +365,10 @@ def test_build_index_dict(adata_cdr3):
             "VJ": {
                 "chain_inds": [1, 2],
                 "unique_seqs": ["AAA", "AHA"],
+                "seq_codes": {
+                    1: np.array([0, 1, -1, 0, -1]),
+                    2: np.array([1, -1, -1, 0, 0]),
+                },
                 "seq_to_cell": {
                     1: {0: [0, 3], 1: [1]},
                     2: {0: [3, 4], 1: [0]},
@@ -330,6 +377,10 @@ def test_build_index_dict(adata_cdr3):
             "VDJ": {
                 "chain_inds": [1, 2],
                 "unique_seqs": ["AAA", "KK", "KKK", "KKY", "LLL"],
+                "seq_codes": {
+                    1: np.array([3, 1, -1, 4, 4]),
+                    2: np.array([2, 2, -1, 0, -1]),
+                },
                 "seq_to_cell": {
                     1: {0: [], 1: [1], 2: [], 3: [0], 4: [3, 4]},
                     2: {0: [3], 1: [], 2: [0, 1], 3: [], 4: []},
@@ -491,6 +542,33 @@ def test_compute_distances6(adata_cdr3, adata_cdr3_mock_distance_calculator):
     )
 
 
+def test_compute_distances6_connectivities(adata_cdr3):
+    """With `receptor_arms="all"`, the distances of both arms are summed up
+    and can exceed the cutoff. This must not overflow the dtype of the
+    distance matrix when computing the connectivities."""
+    tn = IrNeighbors(
+        adata_cdr3,
+        metric="levenshtein",
+        cutoff=1,
+        receptor_arms="all",
+        dual_ir="primary_only",
+        sequence="aa",
+    )
+    tn.compute_distances(n_jobs=1)
+    npt.assert_almost_equal(
+        tn.connectivities.toarray(),
+        np.array(
+            [
+                [1, -1, 0, 0, 0],
+                [-1, 1, 0, 0, 0],
+                [0, 0, 0, 0, 0],
+                [0, 0, 0, 1, 0],
+                [0, 0, 0, 0, 1],
+            ]
+        ),
+    )
+
+
 def test_compute_distances7(adata_cdr3, adata_cdr3_mock_distance_calculator):
     tn = IrNeighbors(
         adata_cdr3,
@@ -629,6 +707,68 @@ def test_compute_distances12(adata_cdr3, adata_cdr3_mock_distance_calculator):
     npt.assert_equal(tn.dist.toarray(), np.zeros((5, 5)))
 
 
+def _cell_dist_mat_brute_force(tn):
+    """Minimum (offsetted) distance over all receptor arms and all
+    combinations of chains for each pair of cells."""
+    res = np.zeros((tn.adata.n_obs, tn.adata.n_obs))
+    for arm_info in tn.index_dict.values():
+        dist_mat = arm_info["dist_mat"].toarray()
+        dist_mat = np.where(dist_mat == 0, dist_mat.T, dist_mat)
+        for c1, c2 in itertools.product(arm_info["chain_inds"], repeat=2):
+            codes1, codes2 = arm_info["seq_codes"][c1], arm_info["seq_codes"][c2]
+            for i, j in itertools.product(range(tn.adata.n_obs), repeat=2):
+                if codes1[i] < 0 or codes2[j] < 0:
+                    continue
+                d = dist_mat[codes1[i], codes2[j]]
+                if d != 0 and (res[i, j] == 0 or d < res[i, j]):
+                    res[i, j] = d
+    return res
+
+
+@pytest.mark.parametrize("receptor_arms", ["VJ", "VDJ", "any"])
+@pytest.mark.parametrize("dual_ir", ["primary_only", "any"])
+def test_cell_dist_mat_min(
+    adata_cdr3, adata_cdr3_mock_distance_calculator, receptor_arms, dual_ir
+):
+    """The sparse matrix implementation of the `any` reduction needs to give
+    the minimum distance over all combinations of chains and arms."""
+    tn = IrNeighbors(
+        adata_cdr3,
+        metric=adata_cdr3_mock_distance_calculator,
+        receptor_arms=receptor_arms,
+        dual_ir=dual_ir,
+        sequence="aa",
+    )
+    tn.compute_distances()
+    expected = _cell_dist_mat_brute_force(tn)
+    assert tn.dist.nnz == np.sum(expected != 0)
+    npt.assert_equal(tn.dist.toarray(), expected)
+
+
+def test_cell_dist_mat_min_chain_collision():
+    """The closest pair of sequences is the primary chain of one cell and the
+    secondary chain of the other cell. The generic reduction based on the
+    coord dict overwrote this minimum with the distance of another
+    combination of chains."""
+    adata = AnnData(
+        obs=pd.DataFrame(
+            {"IR_VJ_1_cdr3": ["AA", "AD"], "IR_VJ_2_cdr3": ["DD", "AA"]},
+            index=["cell1", "cell2"],
+        )
+    )
+    tn = IrNeighbors(
+        adata,
+        metric="levenshtein",
+        cutoff=2,
+        receptor_arms="VJ",
+        dual_ir="any",
+        sequence="aa",
+    )
+    tn.compute_distances(n_jobs=1)
+    npt.assert_equal(_cell_dist_mat_brute_force(tn), np.array([[1, 1], [1, 1]]))
+    npt.assert_equal(tn.dist.toarray(), np.array([[1, 1], [1, 1]]))
+
+
 def test_dist_to_connectivities(adata_cdr3):
     # empty anndata, just need the object
     tn = IrNeighbors(adata_cdr3, metric="alignment", cutoff=10)
@@ -37,25 +37,18 @@ def _reduce_nonzero(A, B, f=np.min):
     ):
         raise ValueError("This only works with sparse matrices in CSC or CSR format. ")
 
-    def _setdiff_coords(A, B):
-        """Returns X and Y coords that only exist in matrix A, but not in B"""
-        coords_A = set(zip(*A.nonzero()))
-        coords_B = set(zip(*B.nonzero()))
-        setdiff = coords_A - coords_B
-        if len(setdiff):
-            ind0, ind1 = zip(*setdiff)
-            return np.array(ind0), np.array(ind1)
-        else:
-            return np.array([]), np.array([])
-
-    # now the indices that exist in both matrices contain the mimimum.
-    # those that only exist in one matrix 0
-    X = A.minimum(B).tolil()
-    # Therefore, we fill those that are in one matrix, but not another
-    not_in_b0, not_in_b1 = _setdiff_coords(A, X)
-    not_in_a0, not_in_a1 = _setdiff_coords(B, X)
-    X[not_in_b0, not_in_b1] = A[not_in_b0, not_in_b1]
-    X[not_in_a0, not_in_a1] = B[not_in_a0, not_in_a1]
+    A = A.tocsr()
+    B = B.tocsr()
+    A_mask = A.astype(bool)
+    B_mask = B.astype(bool)
+
+    # The indices that exist in both matrices contain the minimum.
+    X = A.multiply(B_mask).minimum(B.multiply(A_mask))
+    # Those that only exist in one matrix are taken from that matrix.
+    # All of these are vectorized sparse operations that only
+    # touch the non-zero elements.
+    X = X + (A - A.multiply(B_mask)) + (B - B.multiply(A_mask))
+    X.eliminate_zeros()
 
     return X.tocsr()
 
@@ -80,7 +73,6 @@ def __is_na(x):
     )
 
 
-@np.vectorize
 def _is_na(x):
     """Check if an object or string is NaN.
     The function is vectorized over numpy arrays or pandas Series
@@ -88,7 +80,15 @@ def _is_na(x):
 
     Pandas Series are converted to numpy arrays.
     """
-    return __is_na(x)
+    # Build the mask with array operations instead of calling `__is_na` for
+    # each element. Only elements that are not null need the string comparisons.
+    x = np.asarray(x, dtype=object)
+    is_na = np.asarray(pd.isnull(x))
+    not_na = x[~is_na]
+    is_na[~is_na] = (
+        (not_na == "NaN") | (not_na == "nan") | (not_na == "None") | (not_na == "N/A")
+    )
+    return is_na
 
 
 def _is_true(x):
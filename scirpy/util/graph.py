@@ -20,13 +20,16 @@ def _get_igraph_from_adjacency(adj: scipy.sparse.csr_matrix, edge_type: str = No
     g = ig.Graph(directed=False)
     g.add_vertices(adj.shape[0])  # this adds adjacency.shape[0] vertices
 
-    sources, targets = scipy.sparse.triu(adj, k=1).nonzero()
-    weights = adj[sources, targets].astype("float")
+    # Read edges and weights directly from the COO representation of the upper
+    # triangle. Don't look the weights up with `adj[sources, targets]`: this
+    # element-wise fancy indexing hits a slow path in scipy and returns a dense
+    # `np.matrix`.
+    adj_triu = scipy.sparse.triu(adj, k=1, format="coo")
+    nonzero = adj_triu.data != 0
+    sources, targets = adj_triu.row[nonzero], adj_triu.col[nonzero]
+    weights = adj_triu.data[nonzero].astype("float")
     g.add_edges(list(zip(sources, targets)))
 
-    if isinstance(weights, np.matrix):
-        weights = weights.A1
-
     g.es["weight"] = weights
     if edge_type is not None:
         g.es["type"] = edge_type